@@ -6,8 +6,10 @@ Check an EBAS NasaAmes file.
 """
 import sys
 import logging
+import functools
 from ebas.commandline import EbasCommandline
 from ebas.io.file import nasa_ames
+from parallel_read import add_jobs_argument, map_files
 
 __version__ = '1.00.00'
 
@@ -25,6 +27,7 @@ def add_private_args(parser, cmdline):  # pylint: disable=W0613
     parser_input_group = parser.add_argument_group('input options')
     parser_input_group.add_argument(
         'filenames', nargs='*', help='input file(s), EBAS NASA-Ames format')
+    add_jobs_argument(parser_input_group)
 
 def ebas_check(cmdline):
     """
@@ -38,29 +41,41 @@ def ebas_check(cmdline):
     """
     logger = logging.getLogger('ebas_check')
     args = cmdline.args
+    nas_opt = cmdline.get_custom_args('NASA_READ')
 
     exitcode = 0 # number of failed files (max 255)
-    for filename in args.filenames:
-        nas = read_file(cmdline, logger, filename)
-        if nas is None:
+    for success in map_files(functools.partial(check_file, nas_opt),
+                             args.filenames, jobs=args.jobs):
+        if not success:
             exitcode += 1
     logger.info('checked {} files, {} failed, {} succeeded'.format(
         len(args.filenames), exitcode, len(args.filenames)-exitcode))
     exitcode = min(255, exitcode)
     sys.exit(exitcode)
 
-def read_file(cmdline, logger, filename):
+def check_file(nas_opt, filename):
+    """
+    Checks a single file (may run in a worker process).
+    Parameters:
+        nas_opt   NASA_READ custom arguments
+        filename  filename (including path) of file to be read
+    Returns:
+        True if the file could be read, else False
+    """
+    logger = logging.getLogger('ebas_check')
+    return read_file(nas_opt, logger, filename) is not None
+
+def read_file(nas_opt, logger, filename):
     """
     Reads a single file.
     Parameters:
-        cmdline   EbasCommandline object (wrapper)
+        nas_opt   NASA_READ custom arguments
         logger    logger object
         filename  filename (including path) of file to be read
     Returns:
         EbasNasaAmes file object or None in case of erros.
     """
     nas = nasa_ames.EbasNasaAmes()
-    nas_opt = cmdline.get_custom_args('NASA_READ')
     try:
         nas.read(filename, **nas_opt['nas_read'])
     except IOError as excpt:
@@ -78,9 +93,10 @@ def read_file(cmdline, logger, filename):
                                                          nas.warnings))
     return nas
 
-EbasCommandline(
-    ebas_check,
-    custom_args=['CONFIG', 'LOGGING', 'TIME_CRIT', 'NASA_READ'],
-    private_args=add_private_args,
-    help_description='%(prog)s example for checking a NasaAmes datafile.',
-    version=__version__).run()
+if __name__ == '__main__':
+    EbasCommandline(
+        ebas_check,
+        custom_args=['CONFIG', 'LOGGING', 'TIME_CRIT', 'NASA_READ'],
+        private_args=add_private_args,
+        help_description='%(prog)s example for checking a NasaAmes datafile.',
+        version=__version__).run()
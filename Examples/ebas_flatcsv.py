@@ -6,9 +6,19 @@ Example for reading an EBAS_1.1 NasaAmes datafile.
 """
 import sys
 import logging
+import functools
 import csv
+import io
+import itertools
+import os
+import shutil
+import tempfile
 from ebas.commandline import EbasCommandline
 from ebas.io.file import nasa_ames
+from parallel_read import add_jobs_argument, map_files
+
+# number of rows passed to csv.writer.writerows at a time
+WRITE_CHUNK_ROWS = 5000
 
 __version__ = '1.00.00'
 
@@ -30,6 +40,7 @@ def add_private_args(parser, cmdline):  # pylint: disable=W0613
     parser_input_group.add_argument(
         'filenames', nargs='*',
         help='input file(s), EBAS NASA-Ames format')
+    add_jobs_argument(parser_input_group)
 
 def prepare_csv():
     """
@@ -37,11 +48,10 @@ def prepare_csv():
     Parameters:
         None
     Returns:
-        csv.writer object
+        tuple (output file object, csv.writer object)
     """
     outfile = open("output.csv", "w")
-    csv.register_dialect('ebas', delimiter=',', quotechar='"')
-    csvwriter = csv.writer(outfile, dialect='ebas', quoting=csv.QUOTE_MINIMAL)
+    csvwriter = csv_writer(outfile)
     header = ["Set type code",
               "Timezone",
               "Period code",
@@ -66,7 +76,36 @@ def prepare_csv():
               "Value",
               "Flags"]
     csvwriter.writerow(header)
-    return csvwriter
+    return (outfile, csvwriter)
+
+def csv_writer(outfile):
+    """
+    Sets up the csv object for output (same format for the output file and
+    for the temporary files written in worker processes).
+    Parameters:
+        outfile   file object
+    Returns:
+        csv.writer object
+    """
+    return csv.writer(outfile, delimiter=',', quotechar='"',
+                      quoting=csv.QUOTE_MINIMAL)
+
+def write_rows(csvwriter, rows):
+    """
+    Writes the output rows for one file, in chunks of WRITE_CHUNK_ROWS rows
+    (fewer calls to the csv writer, but never all rows of a file in memory).
+    Parameters:
+        csvwriter   csv.writer object
+        rows        iterable of rows (e.g. generator from csv_rows)
+    Returns:
+        None
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, WRITE_CHUNK_ROWS))
+        if not chunk:
+            break
+        csvwriter.writerows(chunk)
 
 def csv_rows(nas):
     """
@@ -76,6 +115,9 @@ def csv_rows(nas):
     Returns:
         generator (rows (each row is a list with column data))
     """
+    # the sample times are the same for all variables, convert them to
+    # strings only once
+    times = [(str(start), str(end)) for start, end in nas.sample_times]
     for vnum in range(len(nas.variables)):
         row = [nas.get_meta_for_var(vnum, 'type'),
                nas.get_meta_for_var(vnum, 'timezone'),
@@ -96,12 +138,14 @@ def csv_rows(nas):
                nas.get_meta_for_var(vnum, 'comp_name'),
                nas.get_meta_for_var(vnum, 'statistics'),
                nas.get_meta_for_var(vnum, 'unit')]
-        for tim in range(len(nas.sample_times)):
-            yield row + \
-               [nas.sample_times[tim][0],
-                nas.sample_times[tim][1],
-                nas.variables[vnum].values_[tim],
-                nas.variables[vnum].flags[tim]]
+        var = nas.variables[vnum]
+        # zip would silently truncate the output
+        if len(var.values_) != len(times) or len(var.flags) != len(times):
+            raise ValueError(
+                'variable {}: {} values, {} flags for {} samples'.format(
+                    vnum, len(var.values_), len(var.flags), len(times)))
+        for (start, end), value, flags in zip(times, var.values_, var.flags):
+            yield row + [start, end, value, flags]
 
 def ebas_flatcsv(cmdline):
     """
@@ -116,45 +160,118 @@ def ebas_flatcsv(cmdline):
     logger = logging.getLogger('ebas_flatcsv')
     args = cmdline.args
 
-    csvwriter = prepare_csv()
+    outfile, csvwriter = prepare_csv()
 
     exitcode = 0 # number of failed files (max 255)
-    for filename in args.filenames:
-        nas = read_file(args, logger, filename)
-        if nas is None:
-            exitcode += 1
-        else:
-            for row in csv_rows(nas):
-                csvwriter.writerow(row)
-            logger.info(
-                '%d variables with %d sammples exported',
-                len(nas.variables), len(nas.sample_times))
+    tmpdir = None
+    if args.jobs <= 1 or len(args.filenames) <= 1:
+        # serial (same condition as in map_files): stream the rows directly
+        # to the output file
+        export = functools.partial(export_file, args.skip_unitconvert,
+                                   args.ignore_parameter, csvwriter=csvwriter)
+    else:
+        # workers write temporary files, they are copied to the output file
+        # here in input order
+        # All temporary files go to a private directory which is removed in
+        # any case, also for files left over when the run stops early.
+        tmpdir = tempfile.mkdtemp(prefix='ebas_flatcsv_')
+        export = functools.partial(export_file, args.skip_unitconvert,
+                                   args.ignore_parameter, tmpdir=tmpdir)
+    try:
+        for result in map_files(export, args.filenames, jobs=args.jobs):
+            if result is None:
+                exitcode += 1
+            else:
+                tmpname, n_variables, n_samples = result
+                if tmpname is not None:
+                    copy_tmpfile(tmpname, outfile)
+                logger.info(
+                    '%d variables with %d sammples exported',
+                    n_variables, n_samples)
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir, ignore_errors=True)
     exitcode = min(255, exitcode)
     sys.exit(exitcode)
 
-def read_file(args, logger, filename):
+def export_file(skip_unitconvert, ignore_parameter, filename,
+                csvwriter=None, tmpdir=None):
+    """
+    Reads a single file and exports the output rows (may run in a worker
+    process).
+    Parameters:
+        skip_unitconvert  commandline argument --skip_unitconvert
+        ignore_parameter  commandline argument --ignore_parameter
+        filename          filename (including path) of file to be read
+        csvwriter         csv.writer object for writing the rows directly
+                          None: write the rows to a temporary file (in a
+                          worker process, the output file is written by the
+                          main process)
+        tmpdir            directory for the temporary file
+    Returns:
+        tuple (temporary file name or None, number of variables,
+               number of samples)
+        None in case of errors
+    """
+    logger = logging.getLogger('ebas_flatcsv')
+    nas = read_file(skip_unitconvert, ignore_parameter, logger, filename)
+    if nas is None:
+        return None
+    tmpname = None
+    if csvwriter is None:
+        fd, tmpname = tempfile.mkstemp(suffix='.csv', dir=tmpdir)
+        try:
+            # no newline translation here, done when copying to the output
+            with io.open(fd, 'w', newline='') as tmpfile:
+                write_rows(csv_writer(tmpfile), csv_rows(nas))
+        except Exception:
+            os.remove(tmpname)
+            raise
+    else:
+        write_rows(csvwriter, csv_rows(nas))
+    return (tmpname, len(nas.variables), len(nas.sample_times))
+
+def copy_tmpfile(tmpname, outfile):
+    """
+    Copies a temporary file written by export_file to the output file and
+    removes it.
+    Parameters:
+        tmpname   temporary file name
+        outfile   output file object
+    Returns:
+        None
+    """
+    try:
+        with io.open(tmpname, 'r', newline='') as tmpfile:
+            shutil.copyfileobj(tmpfile, outfile)
+    finally:
+        os.remove(tmpname)
+
+def read_file(skip_unitconvert, ignore_parameter, logger, filename):
     """
     Reads a single file.
     Parameters:
-        args      commandline arguments
-        logger    logger object
-        filename  filename (including path) of file to be read
+        skip_unitconvert  commandline argument --skip_unitconvert
+        ignore_parameter  commandline argument --ignore_parameter
+        logger            logger object
+        filename          filename (including path) of file to be read
     Returns:
         EbasNasaAmes file object or None in case of erros.
     """
     logger.info('reading input file {}'.format(filename))
     nas = nasa_ames.EbasNasaAmes()
     try:
-        nas.read(filename, skip_unitconvert=args.skip_unitconvert,
-                 ignore_parameter=args.ignore_parameter)
+        nas.read(filename, skip_unitconvert=skip_unitconvert,
+                 ignore_parameter=ignore_parameter)
     except (IOError, nasa_ames.EbasNasaAmesReadError) as excpt:
         logger.error("file {}: {}".format(filename, str(excpt)))
         return None
     return nas
 
-EbasCommandline(
-    ebas_flatcsv,
-    custom_args=['CONFIG', 'LOGGING', 'TIME_CRIT'],
-    private_args=add_private_args,
-    help_description='%(prog)s example for reading a NasaAmes datafile.',
-    version=__version__).run()
+if __name__ == '__main__':
+    EbasCommandline(
+        ebas_flatcsv,
+        custom_args=['CONFIG', 'LOGGING', 'TIME_CRIT'],
+        private_args=add_private_args,
+        help_description='%(prog)s example for reading a NasaAmes datafile.',
+        version=__version__).run()
@@ -0,0 +1,172 @@
+"""
+parallel_read
+
+Helper for the example scripts: processes a list of input files in a pool of
+worker processes.
+
+Each worker imports the ebas modules (and thus reads the masterdata) once and
+then processes many files. Log messages issued in a worker are collected per
+file and re-issued in the main process, in input order, through the logging
+setup of the main program. The output is thus the same as for a serial run.
+Only a few files per worker are processed ahead of the file which is next in
+input order, so the results kept in the main process are bounded by the number
+of jobs, not by the number of input files.
+
+Results must be picklable. EbasNasaAmes objects are not, so the function
+called for each file should reduce the file object to small, plain data (e.g.
+error counts, or the name of a temporary file with the output).
+"""
+import argparse
+import collections
+import itertools
+import logging
+import multiprocessing
+import multiprocessing.pool
+import traceback
+
+# number of files in progress per worker process (the pool's task queue)
+_FILES_PER_JOB = 2
+
+
+def add_jobs_argument(parser_group):
+    """
+    Adds the --jobs argument to a parser (or parser group).
+
+    Parameters:
+        parser_group    parser or argument group from commandline.getargs()
+    Returns:
+        None
+    """
+    parser_group.add_argument(
+        '--jobs', type=_jobs_type, default=1, metavar='N',
+        help='number of files to be processed in parallel (worker '
+        'processes), default 1')
+
+
+def _jobs_type(string):
+    """
+    Argument type for --jobs: positive integer.
+    """
+    try:
+        jobs = int(string)
+    except ValueError:
+        jobs = 0
+    if jobs < 1:
+        raise argparse.ArgumentTypeError(
+            "must be a positive integer: '{}'".format(string))
+    return jobs
+
+
+class _RecordCollector(logging.Handler):
+    """
+    Logging handler in the worker processes, collects all records for one
+    input file.
+    """
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        # Merge args and exception info into the message text, the record
+        # must be pickled for sending it to the main process.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+def _init_worker(level):
+    """
+    Initializes logging in a worker process. Handlers inherited from the main
+    process (when forking) are removed, all messages are only collected and
+    sent to the main process.
+
+    Parameters:
+        level    effective log level of the main process' root logger
+    Returns:
+        None
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(level)
+
+
+def _process_file(func, filename):
+    """
+    Processes one file in a worker process.
+
+    Parameters:
+        func       function to be called for the file
+        filename   filename (including path)
+    Returns:
+        tuple (log records, result of func, exception, traceback text)
+        exception and traceback text are None if func succeeded
+    """
+    collector = _RecordCollector()
+    root = logging.getLogger()
+    root.addHandler(collector)
+    try:
+        result = func(filename)
+    except Exception as excpt:  # pylint: disable=W0703
+        # W0703: Catching too general exception
+        # The exception is re-raised in the main process, after the messages
+        # logged before have been issued there.
+        return (collector.records, None, excpt, traceback.format_exc())
+    finally:
+        root.removeHandler(collector)
+    return (collector.records, result, None, None)
+
+
+def map_files(func, filenames, jobs=1):
+    """
+    Calls func(filename) for each file, using a pool of worker processes if
+    jobs > 1.
+
+    The main module of the calling program must be import-safe (start the
+    program only if __name__ == '__main__'), and func must be defined on
+    module level (or be a functools.partial of such a function with picklable
+    arguments).
+
+    Parameters:
+        func       function to be called for each file
+        filenames  list of filenames
+        jobs       number of worker processes
+    Returns:
+        generator, results of func in the order of filenames
+    """
+    if jobs <= 1 or len(filenames) <= 1:
+        for filename in filenames:
+            yield func(filename)
+        return
+
+    jobs = min(jobs, len(filenames))
+    pool = multiprocessing.Pool(
+        jobs, initializer=_init_worker,
+        initargs=(logging.getLogger().getEffectiveLevel(),))
+    todo = iter(filenames)
+    window = collections.deque()
+    try:
+        for filename in itertools.islice(todo, _FILES_PER_JOB * jobs):
+            window.append(pool.apply_async(_process_file, (func, filename)))
+        while window:
+            records, result, excpt, tb_text = window.popleft().get()
+            for filename in itertools.islice(todo, 1):
+                window.append(
+                    pool.apply_async(_process_file, (func, filename)))
+            for record in records:
+                logging.getLogger(record.name).handle(record)
+            if excpt is not None:
+                # same as multiprocessing.Pool does for failed tasks: show
+                # the worker's traceback as cause
+                excpt.__cause__ = multiprocessing.pool.RemoteTraceback(tb_text)
+                raise excpt
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()